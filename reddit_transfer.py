@@ -4,21 +4,37 @@ Transfer reddit subscriptions, saved submissions/comments, friends,
 and preferences from one account to another.
 """
 import argparse
+import asyncio
 import collections
 import configparser
-import functools
+import csv
 import getpass
+import itertools
+import json
 import logging
-import pprint
+import os
 import sys
-from typing import Mapping, Optional, Set, Sequence
-from tqdm import tqdm
-import pandas as pd
-import praw
+import time
+from typing import Any, Awaitable, List, Mapping, Optional, Set, Sequence
+import aiohttp
+import asyncpraw
+import asyncprawcore
+import tenacity
 
 log = logging.getLogger('reddit-transfer')
 logging.basicConfig(level=logging.INFO)
 user_agent = "la.natan.reddit-transfer:v0.0.2"
+# Maximum number of API calls in flight per command
+concurrency = 10
+# /api/subscribe accepts up to 100 comma-separated subreddit names per call
+subscribe_batch_size = 100
+# Attempts per subscribe call when reddit answers 429
+subscribe_retries = 3
+# Size of the keep-alive connection pool shared by both accounts
+pool_size = 32
+# Saved listings are cached here between runs, one file per user
+cache_dir = '.cache'
+saved_cache_fields = ['id', 'name', 'title', 'created_utc', 'saved', 'over_18']
 
 
 # Create a custom logger
@@ -38,6 +54,65 @@ def custom_log(message):
     custom_logger.debug(message)
 
 
+# Retry calls that fail on 5xx or connection errors even after
+# asyncprawcore's own retries, so one blip doesn't abort a long run
+retry_transient = tenacity.retry(
+    retry=tenacity.retry_if_exception_type((asyncprawcore.exceptions.ServerError,
+                                            asyncprawcore.exceptions.RequestException)),
+    stop=tenacity.stop_after_attempt(3),
+    wait=tenacity.wait_exponential_jitter(initial=1, max=30),
+    before_sleep=tenacity.before_sleep_log(custom_logger, logging.DEBUG),
+    reraise=True)
+
+
+async def bounded(sem: asyncio.Semaphore, coro: Awaitable) -> Any:
+    async with sem:
+        return await coro
+
+
+async def gather_all(coros: Sequence[Awaitable], labels: Sequence[str]) -> List:
+    """
+    Like asyncio.gather, but lets every coroutine finish before raising so
+    none is left running against a session that's about to be closed.
+    Failures are logged under their label and the first one is re-raised.
+    """
+    results = await asyncio.gather(*coros, return_exceptions=True)
+    failures = [(label, result) for label, result in zip(labels, results)
+                if isinstance(result, BaseException)]
+    for label, e in failures:
+        log.warning('Failed to %s: %s', label, e)
+        custom_log(f'failed:{label}')
+    if failures:
+        raise failures[0][1]
+    return results
+
+
+def http_session() -> aiohttp.ClientSession:
+    # Shared between the two Reddit instances so they reuse each other's
+    # TCP/TLS connections to oauth.reddit.com
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size),
+                                 timeout=aiohttp.ClientTimeout(total=None))
+
+
+class BurstRateLimiter(asyncprawcore.rate_limit.RateLimiter):
+    """
+    Spend the X-Ratelimit-Remaining budget as fast as it's asked for and only
+    wait for X-Ratelimit-Reset once it runs out, instead of spacing calls
+    evenly over the window like asyncprawcore's default limiter.
+
+    The headers are parsed by the inherited update().
+    """
+
+    async def delay(self):
+        # Leave headroom for the calls that are already in flight
+        if self.remaining is None or self.remaining > concurrency:
+            return
+        sleep_seconds = self.reset_timestamp - time.time()
+        if sleep_seconds <= 0:
+            return
+        custom_log(f'Rate limited: sleeping {sleep_seconds:0.2f}s until reset')
+        await asyncio.sleep(sleep_seconds)
+
 
 def prompt(question: str,
            suggestion: Optional[str] = None,
@@ -89,40 +164,109 @@ class Config:
 
 class User:
 
-    def __init__(self, username: str):
+    def __init__(self, username: str,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 use_cache: bool = True):
         self.username = username
+        self.use_cache = use_cache
         password = self.prompt_password()
         self.config = Config(username)
         try:
-            self.reddit = praw.Reddit(username,
-                                      password=password,
-                                      user_agent=user_agent,
-                                      **self.config.read())
+            self.reddit = asyncpraw.Reddit(username,
+                                           password=password,
+                                           user_agent=user_agent,
+                                           requestor_kwargs={'session': session},
+                                           **self.config.read())
         except configparser.NoSectionError:
             raise RuntimeError(f'Did you run `{sys.argv[0]} login {username}?')
+        # asyncprawcore has no public hook for the rate limiter
+        core = self.reddit._core
+        core._rate_limiter = BurstRateLimiter(window_size=core._rate_limiter.window_size)
 
     def prompt_password(self) -> str:
         password = getpass.getpass(f'Password for /u/{self.username}: ')
         return password
 
-    @functools.cached_property
-    def subscriptions(self) -> Set[str]:
+    async def __aenter__(self) -> 'User':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.reddit.close()
+
+    @retry_transient
+    async def subscriptions(self) -> Set[str]:
         log.info('Fetching subreddits for /u/%s', self.username)
-        return {sub.display_name for sub in self.reddit.user.subreddits(limit=None)}
+        return {sub.display_name async for sub in self.reddit.user.subreddits(limit=None)}
 
-    @functools.cached_property
-    def friends(self) -> Set[str]:
+    @retry_transient
+    async def friends(self) -> Set[str]:
         log.info('Fetching friends for /u/%s', self.username)
-        return {friend.name for friend in self.reddit.user.friends()}
+        return {friend.name for friend in await self.reddit.user.friends()}
+
 
+    @property
+    def saved_cache_file(self) -> str:
+        return os.path.join(cache_dir, f'{self.username}.saved.json')
 
-    #Maintains order of posts
-    @functools.cached_property
-    def saved(self) -> Set[str]:
+    def read_saved_cache(self) -> List:
+        if not self.use_cache:
+            return []
+        try:
+            with open(self.saved_cache_file) as fp:
+                entries = json.load(fp)
+        except (OSError, ValueError):
+            return []
+        log.info('Loaded %d cached saved items for /u/%s', len(entries), self.username)
+        models = {'t1': asyncpraw.models.Comment, 't3': asyncpraw.models.Submission}
+        return [models[entry['name'][:2]](self.reddit, _data=entry) for entry in entries]
+
+    def write_saved_cache(self, saved: Mapping[str, Any]) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = [{field: vars(item)[field] for field in saved_cache_fields if field in vars(item)}
+                   for item in saved.values()]
+        with open(self.saved_cache_file, 'w') as fp:
+            json.dump(entries, fp)
+
+    #Maintains order of posts, keyed by fullname (t1_xxx/t3_xxx)
+    @retry_transient
+    async def saved(self) -> collections.OrderedDict[str, Any]:
         log.info('Fetching saved comments/submissions for /u/%s', self.username)
-        sd = []
-        for item in self.reddit.user.me().saved(limit=None):
-            sd.append(item)
+        cached = collections.OrderedDict((item.fullname, item) for item in self.read_saved_cache())
+        sd = collections.OrderedDict()
+
+        def fresh(item) -> None:
+            # Prepend so sd ends up oldest first without a separate reverse;
+            # re-saved items leave their old spot in the cache
+            sd[item.fullname] = item
+            sd.move_to_end(item.fullname, last=False)
+            cached.pop(item.fullname, None)
+
+        # A lazy Redditor for our own name is enough to page
+        # /user/<name>/saved, so skip the /api/v1/me lookup
+        me = await self.reddit.redditor(self.username)
+        # The listing is newest first, so only page until we reach the
+        # newest item we already know about, followed by the second newest.
+        # A match without that is a re-save of an old item, not the point
+        # where the cache takes over. Items unsaved since the cache was
+        # written can't be seen this way; use --no-cache to refetch
+        pending, expect = None, None
+        async for item in me.saved(limit=None):
+            if pending is not None:
+                if item.fullname == expect:
+                    break
+                fresh(pending)
+                pending = None
+            newer = reversed(cached)
+            newest, second = next(newer, None), next(newer, None)
+            if item.fullname == newest:
+                pending, expect = item, second
+            else:
+                fresh(item)
+        else:
+            # Saw the whole listing, so it is the complete answer
+            cached.clear()
+            if pending is not None:
+                fresh(pending)
 
         #Debug if incorrect order
         # with open('savedlog2.txt', 'w') as f:
@@ -130,20 +274,168 @@ class User:
         #         sd.append(item)
         #         f.write(f'{item}\n')
 
-        sd.reverse()
-        return sd
+        cached.update(sd)
+        self.write_saved_cache(cached)
+        return cached
+
+def missing(src: Mapping[str, Any], dst: Mapping[str, Any]) -> List:
+    """
+    Items of src whose fullname isn't in dst, in src's order. Lookups go by
+    fullname so PRAW objects are never compared with each other.
+    """
+    return [thing for name, thing in src.items() if name not in dst]
+
+
+async def wait_for_reset(e: asyncprawcore.exceptions.TooManyRequests) -> None:
+    seconds = float(e.response.headers.get('X-Ratelimit-Reset', 60))
+    custom_log(f'Rate limited: sleeping {seconds:0.0f}s before retrying')
+    await asyncio.sleep(seconds)
+
+
+@retry_transient
+async def subscribe_subreddit(user: User, sub: str) -> None:
+    subreddit = await user.reddit.subreddit(sub)
+    await subreddit.subscribe()
+
 
-def sync_data(src_user: str, dst_user: str) -> None:
-    src = User(src_user)
-    dst = User(dst_user)
+@retry_transient
+async def post_subscribe(user: User, data: Mapping[str, Any]) -> None:
+    await user.reddit.post(asyncpraw.const.API_PATH['subscribe'], data=data)
 
 
-    diff = lambda l1,l2: [x for x in l1 if x not in l2]
+async def subscribe_one(user: User, sub: str) -> None:
+    log.info('Subscribe to /r/%s', sub)
+    for attempt in range(subscribe_retries):
+        try:
+            await subscribe_subreddit(user, sub)
+            return
+        except asyncprawcore.exceptions.TooManyRequests as e:
+            # No point waiting out the window if we're about to give up
+            if attempt < subscribe_retries - 1:
+                await wait_for_reset(e)
+        except asyncprawcore.exceptions.Forbidden:
+            log.info('Failed r/%s', sub)
+            custom_log(f'banned:{sub}')
+            return
+        except Exception:
+            #Add to log these into a sperate category and into a file
+            log.info('Failed r/%s', sub)
+            custom_log(sub)
+            return
+    log.info('Failed r/%s', sub)
+    custom_log(f'ratelimited:{sub}')
+
+
+async def subscribe_batch(user: User, subs: List[str]) -> None:
+    log.info('Subscribe to %d subreddits', len(subs))
+    data = {'action': 'sub',
+            'sr_name': ','.join(subs),
+            'skip_initial_defaults': True}
+    for attempt in range(subscribe_retries):
+        try:
+            await post_subscribe(user, data)
+            return
+        except asyncprawcore.exceptions.TooManyRequests as e:
+            # No point waiting out the window if we're about to give up
+            if attempt < subscribe_retries - 1:
+                await wait_for_reset(e)
+        except (asyncprawcore.exceptions.AsyncPrawcoreException,
+                asyncpraw.exceptions.RedditAPIException) as e:
+            # One bad subreddit fails the whole batch, so retry them one by one
+            custom_log(f'Batch subscribe failed ({e}), retrying individually')
+            for sub in subs:
+                await subscribe_one(user, sub)
+            return
+    # Still throttled; going one by one would only burn more requests
+    for sub in subs:
+        log.info('Failed r/%s', sub)
+        custom_log(f'ratelimited:{sub}')
+
+
+async def subscribe_all(user: User, subs: Set[str], sem: asyncio.Semaphore) -> None:
+    names = list(subs)
+    await asyncio.gather(*[bounded(sem, subscribe_batch(user, names[i:i + subscribe_batch_size]))
+                           for i in range(0, len(names), subscribe_batch_size)])
+
+
+@retry_transient
+async def friend(user: User, name: str) -> None:
+    redditor = await user.reddit.redditor(name)
+    await redditor.friend()
+
+
+@retry_transient
+async def unfriend(user: User, name: str) -> None:
+    redditor = await user.reddit.redditor(name)
+    await redditor.unfriend()
+
+
+@retry_transient
+async def unsave(user: User, thing) -> None:
+    # thing comes from user's own saved listing, so it is already bound to
+    # user.reddit; Submission and Comment both get unsave() from SavableMixin
+    log.info('Unsave %r', thing)
+    await thing.unsave()
+
+
+async def unsave_all(user: User, saved: collections.OrderedDict[str, Any],
+                     things: List, sem: asyncio.Semaphore) -> None:
+    """
+    Unsave things and drop each one from user's saved cache as soon as its
+    own unsave succeeds. Incremental fetches can't notice unsaves, so this
+    is the only way they leave the cache; it's written even if some fail.
+    """
+    async def unsave_and_forget(thing) -> None:
+        await unsave(user, thing)
+        del saved[thing.fullname]
+
+    try:
+        results = await asyncio.gather(*[bounded(sem, unsave_and_forget(thing)) for thing in things],
+                                       return_exceptions=True)
+    finally:
+        user.write_saved_cache(saved)
+    failures = [(thing, result) for thing, result in zip(things, results)
+                if isinstance(result, BaseException)]
+    for thing, e in failures:
+        log.warning('Failed to unsave %r: %s', thing, e)
+        custom_log(f'unsave failed:{thing.fullname}')
+    if failures:
+        raise failures[0][1]
+
+
+@retry_transient
+async def save(model, thing) -> None:
+    # model is the dst Reddit's submission/comment constructor
+    await (await model(thing.id, fetch=False)).save()
+
+
+async def sync_data(src_user: str, dst_user: str, use_cache: bool = True) -> None:
+    async with http_session() as session, \
+            User(src_user, session, use_cache) as src, User(dst_user, session, use_cache) as dst:
+        await _sync_data(src, dst)
+
+
+async def _sync_data(src: User, dst: User) -> None:
+    # Only transfer draws a progress bar, so don't pay for tqdm elsewhere
+    from tqdm import tqdm
+
+    sem = asyncio.Semaphore(concurrency)
 
     # TODO: Leaky abstraction
     if src.config.read()['client_id'] == dst.config.read()['client_id']:
         raise ValueError('You must generate one set of keys per account')
 
+    # The reads are independent and each account has its own rate limiter,
+    # so fetch everything up front in parallel
+    (src_subscriptions, dst_subscriptions,
+     src_friends, dst_friends,
+     src_saved, dst_saved) = await gather_all(
+        [src.subscriptions(), dst.subscriptions(),
+         src.friends(), dst.friends(),
+         src.saved(), dst.saved()],
+        [f'fetch {what} for /u/{user.username}'
+         for what in ('subreddits', 'friends', 'saved') for user in (src, dst)])
+
     # Since these are bulk operations, we could just unsubscribe from all
     # then resubscribe as needed but I've found that there's some lag between
     # subscribing to a subreddit and the Reddit API recognizing that we've
@@ -152,163 +444,154 @@ def sync_data(src_user: str, dst_user: str) -> None:
     # While the above statements are true, i think anyone in a similar situation as me has created a new account
     # and as per latest rules it has a time limit before you can follow users, so i disabled it
 
-    # for sub in dst.subscriptions - src.subscriptions:
+    # for sub in dst_subscriptions - src_subscriptions:
     #     log.info('Unsubscribe from /r/%s', sub)
-    #     dst.reddit.subreddit(sub).unsubscribe()
+    #     await (await dst.reddit.subreddit(sub)).unsubscribe()
 
 
-    for sub in src.subscriptions - dst.subscriptions:
-        log.info('Subscribe to /r/%s', sub)
-        try:
-            dst.reddit.subreddit(sub).subscribe()
-        except:
-            #Add to log these into a sperate category and into a file
-            log.info('Failed r/%s', sub)
-            pass
+    await subscribe_all(dst, src_subscriptions - dst_subscriptions, sem)
 
 
-    for friend in dst.friends - src.friends:
-        log.info('Friend /u/%s', friend)
-        dst.reddit.redditor(friend).unfriend()
+    common = src_friends & dst_friends
+    coros = []
+    labels = []
 
-    for friend in src.friends - dst.friends:
-        log.info('Unfriend /u/%s', friend)
-        dst.reddit.redditor(friend).friend()
+    for name in dst_friends - common:
+        log.info('Unfriend /u/%s', name)
+        coros.append(bounded(sem, unfriend(dst, name)))
+        labels.append(f'unfriend /u/{name}')
 
-    for thing in dst.saved - setsrc.saved:
-        # TODO: Leaky abstraction
-        log.info('Unsave %r', thing)
-        if isinstance(thing, praw.models.Submission):
-            dst.reddit.submission(thing.id).unsave()
-        elif isinstance(thing, praw.models.Comment):
-            dst.reddit.comment(thing.id).unsave()
-        else:
-            raise RuntimeError('unexpected object type')
+    for name in src_friends - common:
+        log.info('Friend /u/%s', name)
+        coros.append(bounded(sem, friend(dst, name)))
+        labels.append(f'friend /u/{name}')
+
+    await gather_all(coros, labels)
+
+    await unsave_all(dst, dst_saved, missing(dst_saved, src_saved), sem)
 
     #Enable if you want to manage saved by time (Use this to remake both lists)
     #latest_saved_posts = sorted(list(user.saved)[:10], key=lambda x: x.created_utc, reverse=True)
 
 
     #Now i am not sure if this will work this way, but i guess we will find out
-    for thing in tqdm(diff(src.saved,dst.saved)):
+    # Saves stay sequential: reddit orders saved items by the time of the
+    # save call, so overlapping them would scramble the order on dst
+    # to_save is already oldest-saved first, which is the order to replay.
+    # Don't sort by created_utc: that's when the post was made, not when it
+    # was saved, and would shuffle the order we're trying to keep
+    to_save = missing(src_saved, dst_saved)
+    # Items are bound to src.reddit, so rebuild them lazily against dst
+    dst_model = {asyncpraw.models.Submission: dst.reddit.submission,
+                 asyncpraw.models.Comment: dst.reddit.comment}
+    # Fixed width and throttled redraws keep the bar cheap on long runs
+    for thing in tqdm(to_save, total=len(to_save), mininterval=0.5,
+                      dynamic_ncols=False, smoothing=0):
         log.info('Save %r', thing)
-        if isinstance(thing, praw.models.Submission):
-            dst.reddit.submission(thing.id).save()
-        elif isinstance(thing, praw.models.Comment):
-            dst.reddit.comment(thing.id).save()
-        else:
+        try:
+            model = dst_model[type(thing)]
+        except KeyError:
             raise RuntimeError('unexpected object type')
+        await save(model, thing)
 
 
 
     #Print to check the last few posts and if the order was maintained
     #-----------------------------------------------------------------#
-    srcsaved = list(src.saved)
-    dstsaved = list(dst.saved)
-    max_length = max(len(srcsaved), len(dstsaved))
-    srcsaved += [None] * (max_length - len(srcsaved))
-    dstsaved += [None] * (max_length - len(dstsaved))
-    df = pd.DataFrame({'rep': srcsaved[-16:], 'anon': dstsaved[-16:]})
-    pd.set_option('display.max_rows', 20)
-    pd.set_option('display.max_columns', None)
-    print(df)
+    rows = list(itertools.zip_longest(src_saved.values(), dst_saved.values()))[-16:]
+    print(f'{"rep":40}{"anon":40}')
+    for rep, anon in rows:
+        print(f'{str(rep)[:38]:40}{str(anon)[:38]:40}')
     #-----------------------------------------------------------------#
 
 
-    log.info(f"Copy preferences from {dst_user}")
-    dst.reddit.user.preferences.update(**src.reddit.user.preferences())
-    pprint.pprint(src.reddit.user.preferences())
-    pprint.pprint(dst.reddit.user.preferences())
+    log.info(f"Copy preferences from {src.username}")
+    src_prefs, dst_prefs = await asyncio.gather(src.reddit.user.preferences(),
+                                                dst.reddit.user.preferences())
+    # Only send what differs; the PATCH accepts partial updates
+    delta = {k: v for k, v in src_prefs.items() if dst_prefs.get(k) != v}
+    if delta:
+        log.info('Update preferences: %s', ', '.join(sorted(delta)))
+        await dst.reddit.user.preferences.update(**delta)
 
 
 #Personal Unpolished function to check stuff and print it into a csv
-def list_saved_posts(username: str) -> None:
+async def list_saved_posts(username: str, use_cache: bool = True) -> None:
 
-    user = User(username)
-    srcsaved = list(user.saved)
+    async with User(username, use_cache=use_cache) as user:
+        saved = await user.saved()
 
-    latest_saved_posts = sorted(list(user.saved)[:10], key=lambda x: x.created_utc, reverse=True)
-    saved_data = []
+    # Define the fields you want to include
+    fields = ['id', 'title', 'created_utc', 'saved', 'over_18']
+    # Take the latest 20 without copying the whole listing
+    latest = reversed(list(itertools.islice(reversed(saved.values()), 20)))
 
     #List latest 20 saved and also saves it in a csv
-    for post in srcsaved[-20:]:
-        post_data = {}
+    with open('saved_posts.csv', 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=fields)
+        writer.writeheader()
+        for post in latest:
+            post_data = {}
 
-        # Define the fields you want to include
-        fields = ['id', 'title', 'created_utc', 'saved', 'over_18']
+            for field in fields:
+                try:
+                    post_data[field] = getattr(post, field, None)
+                except Exception as e:
+                    # Handle any other exceptions if needed
+                    log.warning('Error: %s. Handling missing attribute %s for post with ID %s.', e, field, post.id)
+                    post_data[field] = None
 
-        for field in fields:
-            try:
-                post_data[field] = getattr(post, field, None)
-            except Exception as e:
-                # Handle any other exceptions if needed
-                log.warning('Error: %s. Handling missing attribute %s for post with ID %s.', e, field, post.id)
-                post_data[field] = None
+            writer.writerow(post_data)
+            log.info('Saved post for /u/%s: %s', username, post_data)
 
-        saved_data.append(post_data)
 
-    # Create a DataFrame from the list of dictionaries
-    df = pd.DataFrame(saved_data)
-    df.to_csv('saved_posts.csv', index=False)
-    log.info('DataFrame of saved posts for /u/%s:\n%s', username, df)
+# IF the order is messed up and you want to unsave everything and start over
 
+async def unsaved(username: str, use_cache: bool = True) -> None:
 
-# IF the order is messed up and you want to unsave everything and start over
+    async with User(username, use_cache=use_cache) as user:
+        #saved_posts = [str(item) for item in user.saved][:20]
+        saved = await user.saved()
+        srcsaved = list(saved.values())[-20:]
 
-def unsaved(username: str) -> None:
-    
-    user = User(username)
-    #saved_posts = [str(item) for item in user.saved][:20]
-    srcsaved = list(user.saved)[-20:]
-
-    
-    input("\nTo confirm this will wipe your saved for " + username)
-    z = input("\nAre you sure you want to proceed? (Type proceed)\n")
-
-    if z.lower() == "proceed":
-        
-        #Unsave all, If you messed up something
-        #-----------------------------------------------------------------#
-        for thing in srcsaved:
-            # TODO: Leaky abstraction
-            log.info('Unsave %r', thing)
-            if isinstance(thing, praw.models.Submission):
-                user.reddit.submission(thing.id).unsave()
-            elif isinstance(thing, praw.models.Comment):
-                user.reddit.comment(thing.id).unsave()
-            else:
-                raise RuntimeError('unexpected object type')
-        #-----------------------------------------------------------------#
 
-    else:
-        print("cheers")
-        exit(1)
-    
+        input("\nTo confirm this will wipe your saved for " + username)
+        z = input("\nAre you sure you want to proceed? (Type proceed)\n")
+
+        if z.lower() == "proceed":
+
+            #Unsave all, If you messed up something
+            #-----------------------------------------------------------------#
+            sem = asyncio.Semaphore(concurrency)
+            await unsave_all(user, saved, srcsaved, sem)
+            #-----------------------------------------------------------------#
+
+        else:
+            print("cheers")
+            exit(1)
+
 
 #As mentioned before, if you made a new account, this is the only thing thats going to take time.
 
-def subscribe(src_user: str, dst_user: str) -> None:
-    src = User(src_user)
-    dst = User(dst_user)
+async def subscribe(src_user: str, dst_user: str) -> None:
+    async with http_session() as session, \
+            User(src_user, session) as src, User(dst_user, session) as dst:
 
-    # TODO: Leaky abstraction
-    if src.config.read()['client_id'] == dst.config.read()['client_id']:
-        raise ValueError('You must generate one set of keys per account')
-    
+        # TODO: Leaky abstraction
+        if src.config.read()['client_id'] == dst.config.read()['client_id']:
+            raise ValueError('You must generate one set of keys per account')
 
-    for sub in src.subscriptions - dst.subscriptions:
-        log.info('Subscribe to /r/%s', sub)
-        try:
-            dst.reddit.subreddit(sub).subscribe()
-        except:
-            #Add to log these into a sperate category and into a file
-            log.info('Failed r/%s', sub)
-            custom_log(sub)
-            pass
+        src_subscriptions, dst_subscriptions = await asyncio.gather(src.subscriptions(),
+                                                                    dst.subscriptions())
+        sem = asyncio.Semaphore(concurrency)
+
+        await subscribe_all(dst, src_subscriptions - dst_subscriptions, sem)
 
 
 def main(argv: Sequence[str]):
     parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help=f'Refetch saved listings instead of reading {cache_dir}/')
     subparsers = parser.add_subparsers(help='Specify action', dest='action')
     subparsers.required = True
 
@@ -336,13 +619,13 @@ def main(argv: Sequence[str]):
     if args.action == 'login':
         Config(args.username).login()
     elif args.action == 'transfer':
-        sync_data(args.src_user, args.dst_user)
+        asyncio.run(sync_data(args.src_user, args.dst_user, args.use_cache))
     elif args.action == 'list':
-        list_saved_posts(args.username)
+        asyncio.run(list_saved_posts(args.username, args.use_cache))
     elif args.action == 'unsave':
-        unsaved(args.username)
+        asyncio.run(unsaved(args.username, args.use_cache))
     elif args.action == 'subscribe':
-        subscribe(args.src_user, args.dst_user)
+        asyncio.run(subscribe(args.src_user, args.dst_user))
 
     else:
         exit(1)